@@ -8,10 +8,15 @@ import os
 import sys
 import time
 import json
+import ctypes
+import selectors
+import socket
+import struct
 import subprocess
 import threading
 import queue
 import signal
+from array import array
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
@@ -23,6 +28,260 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Checked once so per-packet handlers skip the logging call entirely
+_DEBUG = logger.isEnabledFor(logging.DEBUG)
+
+# Ring buffer sizes for per-packet RTP samples
+RTP_RING_SIZE = 100
+BITRATE_RING_SIZE = 8192
+
+# RFC 3550 A.1 sequence number checks: a forward jump of MAX_DROPOUT or
+# more, or a step back of more than MAX_MISORDER, is not trusted until the
+# next packet confirms it as a restarted sequence
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+RTP_SEQ_MOD = 1 << 16
+
+# Seconds without a packet after which an RTP source is retired; its
+# packet counts stay in the capture totals
+RTP_SOURCE_TIMEOUT = 30.0
+
+# Seconds a get_metrics() snapshot is reused
+METRICS_CACHE_TTL = 1.0
+
+# Fields printed by the tshark fallback, in the order
+# _parse_tshark_fields() unpacks them
+TSHARK_FIELDS = (
+    'frame.time_epoch',
+    'frame.len',
+    'udp.srcport',
+    'udp.dstport',
+    'rtp.seq',
+    'rtp.timestamp',
+    'rtp.p_type',
+    'rtp.marker',
+    'rtp.ssrc',
+)
+
+# Most frames read from a packet socket per wakeup
+SOCKET_BATCH_SIZE = 256
+
+# Ethernet header length and the IPv4 ethertype, for raw packet sockets
+ETH_HLEN = 14
+ETH_P_IP = 0x0800
+
+# Classic BPF opcodes (linux/filter.h) used for the packet socket filter
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LD_B_IND = 0x50
+BPF_LDX_B_MSH = 0xb1
+BPF_ALU_AND_K = 0x54
+BPF_JMP_JA = 0x05
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JGE_K = 0x35
+BPF_JMP_JSET_K = 0x45
+BPF_RET_K = 0x06
+SO_ATTACH_FILTER = 26
+
+# struct sock_filter and struct sock_fprog
+_BPF_INSN = struct.Struct('HBBI')
+_BPF_PROG = struct.Struct('HP')
+
+# Promiscuous mode for a packet socket (linux/if_packet.h), held as a
+# membership for as long as the socket is open; struct packet_mreq
+SOL_PACKET = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_MR_PROMISC = 1
+_PACKET_MREQ = struct.Struct('iHH8s')
+
+# Kernel receive timestamps for packet socket frames (asm-generic/socket.h),
+# delivered as a struct timespec control message
+SO_TIMESTAMPNS = 35
+_TIMESPEC = struct.Struct('ll')
+
+# RTP timestamp clock rate of video payloads (RFC 3551)
+RTP_VIDEO_CLOCK_RATE = 90000
+
+try:
+    import pcap  # pypcap - in-process libpcap capture
+except ImportError:
+    pcap = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps_json(obj) -> bytes:
+    """Serialize to compact JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+# Precompiled header layouts: UDP header and the RTP fixed header
+# (V/P/X/CC, M/PT, sequence, timestamp, SSRC)
+_UDP_HDR = struct.Struct('!HHHH')
+_RTP_FIXED = struct.Struct('!BBHII')
+
+def parse_rtp(buf: bytes, ip_off: int) -> Tuple[int, int, int, int, int, int, int]:
+    """
+    Decode UDP ports and the RTP fixed header of a raw IPv4 frame.
+    
+    Returns (src_port, dst_port, seq, rtp_timestamp, payload_type, marker,
+    ssrc).
+    src_port is -1 when the frame is not IPv4/UDP, seq is -1 when the
+    payload is not RTP version 2.
+    """
+    n = len(buf)
+    if n < ip_off + 28 or (buf[ip_off] >> 4) != 4 or buf[ip_off + 9] != 17:
+        return -1, -1, -1, 0, 0, 0, 0
+    
+    udp_off = ip_off + (buf[ip_off] & 0x0F) * 4
+    if n < udp_off + 8:
+        return -1, -1, -1, 0, 0, 0, 0
+    
+    src_port, dst_port, _, _ = _UDP_HDR.unpack_from(buf, udp_off)
+    
+    rtp_off = udp_off + 8
+    if n < rtp_off + 12:
+        return src_port, dst_port, -1, 0, 0, 0, 0
+    
+    flags, marker_pt, seq_num, rtp_timestamp, ssrc = _RTP_FIXED.unpack_from(buf, rtp_off)
+    if (flags >> 6) != 2:
+        return src_port, dst_port, -1, 0, 0, 0, 0
+    
+    return src_port, dst_port, seq_num, rtp_timestamp, marker_pt & 0x7F, marker_pt >> 7, ssrc
+
+def _split_cpus() -> Optional[Tuple[set, set]]:
+    """
+    Split the CPUs this process may run on between tshark and the analyzer.
+    
+    Returns (tshark CPUs, analyzer CPU), or None when only one CPU is
+    available or the platform has no affinity API.
+    """
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < 2:
+        return None
+    
+    return set(cpus[:-1]), {cpus[-1]}
+
+class MetricsWriter:
+    """
+    Background writer for the metrics output file
+    
+    Only the latest payload is kept: submitting while a write is pending
+    replaces the pending payload, so the caller never blocks on disk I/O.
+    Each write goes to a temporary file that is atomically renamed over
+    the output file, so readers never see a partially written file.
+    """
+    
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self._pending = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._write_loop)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def submit(self, payload: Dict):
+        """Queue payload for writing, replacing any stale pending payload"""
+        try:
+            self._pending.put_nowait(payload)
+        except queue.Full:
+            try:
+                self._pending.get_nowait()
+            except queue.Empty:
+                pass
+            self._pending.put_nowait(payload)
+    
+    def close(self):
+        """Write out the pending payload and stop the writer thread"""
+        self._pending.put(None)
+        self._thread.join(timeout=5)
+    
+    def _write_loop(self):
+        tmp_file = self.output_file + '.tmp'
+        while True:
+            payload = self._pending.get()
+            if payload is None:
+                break
+            
+            try:
+                with open(tmp_file, 'wb') as f:
+                    f.write(_dumps_json(payload))
+                os.replace(tmp_file, self.output_file)
+            except OSError as e:
+                logger.error(f"Error writing metrics: {e}")
+
+class CaptureStats:
+    """Packet counters, slotted so per-packet updates skip dict hashing"""
+    
+    __slots__ = ('total_packets', 'video_packets', 'rtp_packets',
+                 'lost_packets', 'start_time')
+    
+    def __init__(self):
+        self.total_packets = 0
+        self.video_packets = 0
+        self.rtp_packets = 0
+        self.lost_packets = 0
+        self.start_time = None
+
+class RtpSource:
+    """
+    Per-SSRC RTP state: interarrival jitter and RFC 3550 A.1 loss accounting
+    
+    Sequence numbers are extended past 16 bits as they wrap. Packets of
+    earlier runs of a restarted source are kept in prior_expected and
+    prior_received.
+    """
+    
+    __slots__ = ('jitter', 'arrival', 'rtp_timestamp', 'base_seq', 'max_seq',
+                 'bad_seq', 'received', 'prior_expected', 'prior_received')
+    
+    def __init__(self, arrival: float, rtp_timestamp: int, seq: int):
+        self.jitter = 0.0
+        self.arrival = arrival
+        self.rtp_timestamp = rtp_timestamp
+        self.base_seq = seq
+        self.max_seq = seq
+        self.bad_seq = RTP_SEQ_MOD + 1  # Matches no sequence number
+        self.received = 1
+        self.prior_expected = 0
+        self.prior_received = 0
+    
+    def expected(self) -> int:
+        """Packets the source has sent so far, judging by sequence numbers"""
+        return self.prior_expected + self.max_seq - self.base_seq + 1
+    
+    def lost(self) -> int:
+        """Packets missing so far"""
+        # Late (reordered) packets count as received, so duplicates can
+        # briefly push the count past what the source has sent
+        return max(0, self.expected() - self.prior_received - self.received)
+    
+    def update_seq(self, seq: int):
+        """Account for one received sequence number (RFC 3550 A.1)"""
+        udelta = (seq - self.max_seq) % RTP_SEQ_MOD
+        if udelta < MAX_DROPOUT:
+            # In order, possibly with a gap
+            self.max_seq += udelta
+            self.received += 1
+        elif udelta <= RTP_SEQ_MOD - MAX_MISORDER:
+            # Large jump: a stray packet, unless the next one follows it
+            if seq == self.bad_seq:
+                self.prior_expected = self.expected()
+                self.prior_received += self.received
+                self.base_seq = self.max_seq = seq
+                self.received = 1
+            else:
+                self.bad_seq = (seq + 1) % RTP_SEQ_MOD
+        else:
+            # Duplicate or reordered packet
+            self.received += 1
+
 class PacketCapture:
     """
     Advanced packet capture and analysis for CCTV monitoring
@@ -32,23 +291,51 @@ class PacketCapture:
         self.interface = interface
         self.capture_filter = capture_filter
         self.capture_process = None
+        self.pcap_handle = None
+        self.packet_socket = None
         self.analysis_thread = None
-        self.packet_queue = queue.Queue()
+        self._analyzer_cpus = None
         self.running = False
-        self.statistics = {
-            'total_packets': 0,
-            'video_packets': 0,
-            'rtp_packets': 0,
-            'lost_packets': 0,
-            'jitter_samples': [],
-            'delay_samples': [],
-            'bitrate_samples': [],
-            'start_time': None
-        }
+        self.stats = CaptureStats()
+        self._metrics_cache = None
+        self._metrics_cache_time = 0.0
+        
+        # RTP samples are kept in fixed-size ring buffers, one C array per
+        # field, so recording a sample never allocates or shifts a list
+        self._rtp_arrival = array('d', [0.0]) * RTP_RING_SIZE
+        self._rtp_head = 0
+        self._rtp_count = 0
+        
+        self._bitrate_ts = array('d', [0.0]) * BITRATE_RING_SIZE
+        self._bitrate_bytes = array('I', [0]) * BITRATE_RING_SIZE
+        self._bitrate_head = 0
+        self._bitrate_tail = 0
+        self._last_evict = 0.0
+        
+        # Jitter and loss state per RTP source (SSRC -> RtpSource). Each
+        # camera has its own RTP timestamp base and sequence numbers, so
+        # sources never share an estimator.
+        self._rtp_sources = {}
+        self._expected_packets = 0
+        self._retired_expected = 0
+        self._retired_lost = 0
+        self._last_source_expiry = 0.0
         
         # Video analysis parameters
         self.video_ports = [554, 8000, 8080, 1935]  # Common video streaming ports
-        self.rtp_payload_types = [96, 97, 98, 99, 26]  # Common video payload types
+        self.rtp_payload_types = frozenset({96, 97, 98, 99, 26})  # Common video payload types
+        
+        # One byte per UDP port, non-zero for video ports and the common RTP
+        # port range, so classifying a packet is two table lookups
+        self._video_port_table = bytearray(65536)
+        self._video_port_table[16384:] = b'\x01' * (65536 - 16384)
+        for port in self.video_ports:
+            self._video_port_table[port] = 1
+        
+        # Same for the 7-bit RTP payload type
+        self._payload_type_table = bytearray(128)
+        for payload_type in self.rtp_payload_types:
+            self._payload_type_table[payload_type] = 1
         
         # Metrics thresholds
         self.jitter_threshold = 50.0  # ms
@@ -56,6 +343,79 @@ class PacketCapture:
         self.packet_loss_threshold = 1.0  # %
         
     def start_capture(self) -> bool:
+        """Start packet capture, in-process via libpcap when available"""
+        if pcap is None:
+            # A raw packet socket cannot compile a user BPF expression, tshark can
+            if hasattr(socket, 'AF_PACKET') and not self.capture_filter:
+                logger.info("pypcap not installed, capturing from a packet socket")
+                if self._start_socket_capture():
+                    return True
+            
+            logger.info("Falling back to tshark")
+            return self._start_tshark_capture()
+        
+        try:
+            logger.info(f"Starting packet capture on interface {self.interface}")
+            
+            # Immediate mode hands packets over as they arrive instead of
+            # waiting for the kernel buffer to fill up
+            self.pcap_handle = pcap.pcap(
+                name=self.interface,
+                promisc=True,
+                immediate=True,
+                timeout_ms=1
+            )
+            
+            self.pcap_handle.setfilter(self._build_capture_filter())
+            self.pcap_handle.setnonblock(True)
+            
+            self._start_analysis_thread(self._capture_packets)
+            
+            logger.info("Packet capture started successfully")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to start packet capture: {e}")
+            self.pcap_handle = None
+            return False
+    
+    def _start_socket_capture(self) -> bool:
+        """Start packet capture on a Linux AF_PACKET socket"""
+        try:
+            logger.info(f"Starting packet capture on interface {self.interface}")
+            
+            # IPv4 frames only, delivered with their Ethernet header
+            self.packet_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                                               socket.htons(ETH_P_IP))
+            self._attach_socket_filter(self.packet_socket)
+            self.packet_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            self.packet_socket.bind((self.interface, ETH_P_IP))
+            self._enable_promiscuous(self.packet_socket)
+            self.packet_socket.setblocking(False)
+            
+            self._start_analysis_thread(self._capture_socket_packets)
+            
+            logger.info("Packet capture started successfully")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to start packet capture: {e}")
+            if self.packet_socket:
+                self.packet_socket.close()
+                self.packet_socket = None
+            return False
+    
+    def _enable_promiscuous(self, sock: socket.socket):
+        """Put the interface in promiscuous mode while the socket is open, as libpcap does"""
+        # Needed on a mirror port, where camera traffic is addressed to other hosts
+        try:
+            mreq = _PACKET_MREQ.pack(socket.if_nametoindex(self.interface),
+                                     PACKET_MR_PROMISC, 0, b'')
+            sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, mreq)
+        except OSError as e:
+            logger.error(f"Failed to enable promiscuous mode on {self.interface}: {e}")
+    
+    def _start_tshark_capture(self) -> bool:
         """Start packet capture using tshark"""
         try:
             # Build tshark command
@@ -63,42 +423,39 @@ class PacketCapture:
                 'tshark',
                 '-i', self.interface,
                 '-l',  # Line buffered output
-                '-T', 'json',  # JSON output format
-                '-e', 'frame.number',
-                '-e', 'frame.time_relative',
-                '-e', 'frame.len',
-                '-e', 'ip.src',
-                '-e', 'ip.dst',
-                '-e', 'udp.srcport',
-                '-e', 'udp.dstport',
-                '-e', 'rtp.seq',
-                '-e', 'rtp.timestamp',
-                '-e', 'rtp.p_type',
-                '-e', 'rtp.marker',
-                '-Y', 'udp'  # Only capture UDP packets
+                '-n',  # No name resolution
+                '-T', 'fields',  # One '|' separated line per packet
+                '-E', 'separator=|',
+                '-E', 'occurrence=f',  # First value of repeated fields
+                '-E', 'header=n'
             ]
             
-            if self.capture_filter:
-                cmd.extend(['-f', self.capture_filter])
+            for field in TSHARK_FIELDS:
+                cmd.extend(['-e', field])
+            
+            cmd.extend(['-f', self._build_capture_filter()])
             
             logger.info(f"Starting packet capture on interface {self.interface}")
             logger.info(f"Command: {' '.join(cmd)}")
             
+            # Run tshark (and the dumpcap it spawns) and the analyzer thread
+            # on separate CPUs so they do not compete for the same core
+            preexec_fn = None
+            cpu_split = _split_cpus()
+            if cpu_split:
+                tshark_cpus, self._analyzer_cpus = cpu_split
+                preexec_fn = lambda: os.sched_setaffinity(0, tshark_cpus)
+            
             # Start tshark process
             self.capture_process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1
+                bufsize=0,
+                preexec_fn=preexec_fn
             )
             
-            # Start analysis thread
-            self.running = True
-            self.statistics['start_time'] = time.time()
-            self.analysis_thread = threading.Thread(target=self._analyze_packets)
-            self.analysis_thread.daemon = True
-            self.analysis_thread.start()
+            self._start_analysis_thread(self._analyze_packets)
             
             logger.info("Packet capture started successfully")
             return True
@@ -107,6 +464,95 @@ class PacketCapture:
             logger.error(f"Failed to start packet capture: {e}")
             return False
     
+    def _build_capture_filter(self) -> str:
+        """Build the BPF filter so non-video traffic is dropped in the kernel"""
+        # UDP on a video port or the RTP port range, whose payload starts
+        # with RTP version 2
+        ports = ' or '.join(f"port {port}" for port in self.video_ports)
+        bpf_filter = f"udp and (portrange 16384-65535 or {ports}) and udp[8] & 0xc0 = 0x80"
+        
+        if self.capture_filter:
+            bpf_filter += f" and ({self.capture_filter})"
+        
+        return bpf_filter
+    
+    def _build_socket_filter(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Assemble the classic BPF equivalent of _build_capture_filter()
+        for a packet socket, which has no libpcap to compile expressions.
+        
+        Passes first-fragment IPv4/UDP frames with a video port or a port
+        in the RTP range on either side whose payload is RTP version 2.
+        """
+        program = []
+        labels = {}
+        
+        def emit(code, k=0, jt=None, jf=None):
+            program.append((code, jt, jf, k))
+        
+        emit(BPF_LD_H_ABS, ETH_HLEN - 2)              # Ethertype
+        emit(BPF_JMP_JEQ_K, ETH_P_IP, jf='reject')
+        emit(BPF_LD_B_ABS, ETH_HLEN + 9)              # IP protocol
+        emit(BPF_JMP_JEQ_K, 17, jf='reject')
+        emit(BPF_LD_H_ABS, ETH_HLEN + 6)              # Fragment offset
+        emit(BPF_JMP_JSET_K, 0x1FFF, jt='reject')
+        emit(BPF_LDX_B_MSH, ETH_HLEN)                 # X = IP header length
+        for port_off in (0, 2):                       # Source, then destination port
+            emit(BPF_LD_H_IND, ETH_HLEN + port_off)
+            emit(BPF_JMP_JGE_K, 16384, jt='rtp')
+            for port in self.video_ports:
+                emit(BPF_JMP_JEQ_K, port, jt='rtp')
+        emit(BPF_JMP_JA, 'reject')
+        
+        labels['rtp'] = len(program)
+        emit(BPF_LD_B_IND, ETH_HLEN + 8)              # First RTP byte
+        emit(BPF_ALU_AND_K, 0xC0)
+        emit(BPF_JMP_JEQ_K, 0x80, jf='reject')
+        emit(BPF_RET_K, 0x40000)                      # Accept the whole frame
+        
+        labels['reject'] = len(program)
+        emit(BPF_RET_K, 0)
+        
+        # Jumps are relative to the next instruction and only go forward
+        resolved = []
+        for i, (code, jt, jf, k) in enumerate(program):
+            if code == BPF_JMP_JA:
+                k = labels[k] - i - 1
+            jt = labels[jt] - i - 1 if jt else 0
+            jf = labels[jf] - i - 1 if jf else 0
+            resolved.append((code, jt, jf, k))
+        
+        return resolved
+    
+    def _attach_socket_filter(self, sock: socket.socket):
+        """Attach the video traffic filter so other frames are dropped in the kernel"""
+        try:
+            program = self._build_socket_filter()
+            code = ctypes.create_string_buffer(
+                b''.join(_BPF_INSN.pack(*insn) for insn in program))
+            # The kernel copies the program, the buffer only has to outlive the call
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                            _BPF_PROG.pack(len(program), ctypes.addressof(code)))
+            
+        except OSError as e:
+            # Frames are still filtered in the capture thread
+            logger.error(f"Failed to attach socket filter: {e}")
+    
+    def _start_analysis_thread(self, target):
+        """Start the thread feeding packets into the analyzer"""
+        self.running = True
+        self.stats.start_time = time.time()
+        self.analysis_thread = threading.Thread(target=self._run_analysis, args=(target,))
+        self.analysis_thread.daemon = True
+        self.analysis_thread.start()
+    
+    def _run_analysis(self, target):
+        """Run the analysis loop; the capture stops when it returns, even on error"""
+        try:
+            target()
+        finally:
+            self.running = False
+    
     def stop_capture(self):
         """Stop packet capture"""
         logger.info("Stopping packet capture...")
@@ -125,168 +571,342 @@ class PacketCapture:
             self.analysis_thread.join(timeout=5)
             self.analysis_thread = None
         
+        if self.pcap_handle:
+            self.pcap_handle.close()
+            self.pcap_handle = None
+        
+        if self.packet_socket:
+            self.packet_socket.close()
+            self.packet_socket = None
+        
         logger.info("Packet capture stopped")
     
-    def _analyze_packets(self):
-        """Analyze packets from tshark output"""
+    def _capture_packets(self):
+        """Read and decode packets directly from libpcap"""
+        logger.info("Starting packet analysis thread")
+        
+        link_len = self.pcap_handle.dloff
+        frames = []
+        selector = selectors.DefaultSelector()
+        selector.register(self.pcap_handle.fileno(), selectors.EVENT_READ)
+        
+        while self.running:
+            try:
+                # Block on the capture fd, the timeout only bounds how long
+                # stop_capture() waits for this thread
+                if selector.select(timeout=0.5):
+                    # Collect everything libpcap has buffered, then process
+                    # it as one batch
+                    self.pcap_handle.dispatch(-1, self._collect_frame, frames)
+                    self._process_batch(self._decode_frames(frames, link_len))
+                    frames.clear()
+                    
+            except Exception as e:
+                logger.error(f"Error in packet analysis: {e}")
+                break
+        
+        selector.close()
+        logger.info("Packet analysis thread stopped")
+    
+    def _capture_socket_packets(self):
+        """Read and decode packets from the AF_PACKET socket"""
         logger.info("Starting packet analysis thread")
         
-        packet_buffer = ""
+        sock = self.packet_socket
+        recvmsg_into = sock.recvmsg_into
+        video_port_table = self._video_port_table
+        unpack_timespec = _TIMESPEC.unpack
         
-        while self.running and self.capture_process:
+        # Frames are received into one preallocated buffer and decoded in
+        # place, nothing is allocated per packet until it is accepted
+        buf = bytearray(65536)
+        view = memoryview(buf)
+        buffers = [buf]
+        ancbufsize = socket.CMSG_SPACE(_TIMESPEC.size)
+        
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        
+        while self.running:
             try:
-                # Read output from tshark
-                if self.capture_process.poll() is None:
-                    line = self.capture_process.stdout.readline()
-                    if line:
-                        packet_buffer += line
-                        
-                        # Try to parse complete JSON objects
-                        if packet_buffer.strip().endswith('}'):
-                            try:
-                                packets = json.loads(packet_buffer.strip())
-                                if isinstance(packets, list):
-                                    for packet in packets:
-                                        self._process_packet(packet)
-                                else:
-                                    self._process_packet(packets)
-                                packet_buffer = ""
-                            except json.JSONDecodeError:
-                                # Continue accumulating buffer
-                                pass
+                if not selector.select(timeout=0.5):
+                    continue
+                
+                # Drain whatever the socket has queued with non-blocking
+                # reads, so one wakeup covers a burst of packets
+                packets = []
+                for _ in range(SOCKET_BATCH_SIZE):
+                    try:
+                        length, ancdata, _, _ = recvmsg_into(buffers, ancbufsize)
+                    except BlockingIOError:
+                        break
+                    
+                    src_port, dst_port, seq_num, rtp_timestamp, payload_type, marker, ssrc = \
+                        parse_rtp(view[:length], ETH_HLEN)
+                    
+                    # Frames queued before the socket filter was attached are
+                    # not filtered by the kernel
+                    if seq_num < 0 or not (video_port_table[src_port] | video_port_table[dst_port]):
+                        continue
+                    
+                    # Arrival time as stamped by the kernel, like libpcap
+                    # and tshark report it; the clock is a fallback
+                    if ancdata:
+                        sec, nsec = unpack_timespec(ancdata[0][2])
+                        timestamp = sec + nsec * 1e-9
                     else:
-                        time.sleep(0.1)
-                else:
-                    break
+                        timestamp = time.time()
                     
+                    packets.append((timestamp, length, src_port, dst_port,
+                                    (seq_num, rtp_timestamp, payload_type, marker, ssrc)))
+                
+                self._process_batch(packets)
+                
             except Exception as e:
                 logger.error(f"Error in packet analysis: {e}")
                 break
         
+        selector.close()
         logger.info("Packet analysis thread stopped")
     
-    def _process_packet(self, packet: Dict):
-        """Process individual packet"""
-        try:
-            layers = packet.get('_source', {}).get('layers', {})
+    @staticmethod
+    def _collect_frame(timestamp: float, pkt: bytes, frames: list):
+        """libpcap callback, queues a raw frame for the next batch"""
+        frames.append((timestamp, pkt))
+    
+    def _decode_frames(self, frames: List[Tuple[float, bytes]], ip_off: int) -> list:
+        """Decode IPv4/UDP/RTP headers of a batch of raw frames"""
+        packets = []
+        append = packets.append
+        for timestamp, pkt in frames:
+            src_port, dst_port, seq_num, rtp_timestamp, payload_type, marker, ssrc = \
+                parse_rtp(pkt, ip_off)
+            if src_port < 0:
+                continue
             
-            # Extract frame information
-            frame_info = layers.get('frame', {})
-            frame_number = frame_info.get('frame.number', ['0'])[0]
-            frame_time = float(frame_info.get('frame.time_relative', ['0'])[0])
-            frame_len = int(frame_info.get('frame.len', ['0'])[0])
+            rtp_info = None
+            if seq_num >= 0:
+                rtp_info = (seq_num, rtp_timestamp, payload_type, marker, ssrc)
             
-            # Extract IP information
-            ip_info = layers.get('ip', {})
-            src_ip = ip_info.get('ip.src', [''])[0]
-            dst_ip = ip_info.get('ip.dst', [''])[0]
+            append((timestamp, len(pkt), src_port, dst_port, rtp_info))
+        
+        return packets
+    
+    def _analyze_packets(self):
+        """Analyze packets from tshark output"""
+        logger.info("Starting packet analysis thread")
+        
+        if self._analyzer_cpus:
+            try:
+                # Only affects this thread
+                os.sched_setaffinity(0, self._analyzer_cpus)
+            except OSError as e:
+                logger.error(f"Failed to set analyzer CPU affinity: {e}")
+        
+        stdout_fd = self.capture_process.stdout.fileno()
+        selector = selectors.DefaultSelector()
+        selector.register(stdout_fd, selectors.EVENT_READ)
+        partial = b''
+        
+        try:
+            while self.running:
+                # Sleep in the kernel until tshark writes, the timeout only
+                # bounds how long stop_capture() waits for this thread
+                if not selector.select(timeout=0.5):
+                    continue
+                
+                chunk = os.read(stdout_fd, 65536)
+                if not chunk:
+                    break  # tshark exited
+                
+                # Each line is one complete packet, no JSON to reassemble;
+                # all complete lines of a read are processed as one batch.
+                # int() and float() accept ASCII bytes, so nothing is decoded.
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()
+                packets = []
+                for line in lines:
+                    packet = self._parse_tshark_fields(line.split(b'|'))
+                    if packet:
+                        packets.append(packet)
+                self._process_batch(packets)
+                    
+        except Exception as e:
+            logger.error(f"Error in packet analysis: {e}")
+        finally:
+            selector.close()
+        
+        logger.info("Packet analysis thread stopped")
+    
+    def _parse_tshark_fields(self, fields: List[bytes]) -> Optional[tuple]:
+        """Convert one line of tshark field output into header fields"""
+        try:
+            (frame_time, frame_len, src_port, dst_port,
+             rtp_seq, rtp_timestamp, rtp_payload_type, rtp_marker, rtp_ssrc) = fields
             
-            # Extract UDP information
-            udp_info = layers.get('udp', {})
-            src_port = int(udp_info.get('udp.srcport', ['0'])[0])
-            dst_port = int(udp_info.get('udp.dstport', ['0'])[0])
+            rtp_info = None
+            if rtp_seq:
+                rtp_info = (
+                    int(rtp_seq),
+                    int(rtp_timestamp),
+                    int(rtp_payload_type),
+                    int(rtp_marker in (b'1', b'True')),
+                    int(rtp_ssrc or b'0', 0)  # Printed as hex, e.g. 0x1234abcd
+                )
             
-            # Update statistics
-            self.statistics['total_packets'] += 1
+            return (float(frame_time), int(frame_len),
+                    int(src_port or 0), int(dst_port or 0), rtp_info)
             
+        except ValueError as e:  # Wrong field count or a non-numeric field
+            if _DEBUG:
+                logger.debug("Skipping malformed tshark line: %s", e)
+            return None
+    
+    def _process_batch(self, packets: List[Tuple[float, int, int, int,
+                                                 Optional[Tuple[int, int, int, int, int]]]]):
+        """Process a batch of decoded packets"""
+        if not packets:
+            return
+        
+        # Bind per-batch so the loop does no attribute lookups
+        video_port_table = self._video_port_table
+        video_packets = 0
+        rtp_samples = []
+        
+        for frame_time, frame_len, src_port, dst_port, rtp_info in packets:
             # Check if this is a video packet
-            if self._is_video_packet(src_port, dst_port):
-                self.statistics['video_packets'] += 1
+            if video_port_table[src_port] | video_port_table[dst_port]:
+                video_packets += 1
                 
                 # Check for RTP
-                rtp_info = layers.get('rtp', {})
                 if rtp_info:
-                    self.statistics['rtp_packets'] += 1
-                    self._analyze_rtp_packet(rtp_info, frame_time, frame_len)
-            
-            # Add to queue for further processing
-            packet_data = {
-                'frame_number': frame_number,
-                'timestamp': frame_time,
-                'length': frame_len,
-                'src_ip': src_ip,
-                'dst_ip': dst_ip,
-                'src_port': src_port,
-                'dst_port': dst_port,
-                'is_video': self._is_video_packet(src_port, dst_port),
-                'rtp_info': rtp_info
-            }
-            
-            self.packet_queue.put(packet_data)
-            
-        except Exception as e:
-            logger.error(f"Error processing packet: {e}")
-    
-    def _is_video_packet(self, src_port: int, dst_port: int) -> bool:
-        """Check if packet is likely a video packet"""
-        return (src_port in self.video_ports or 
-                dst_port in self.video_ports or
-                src_port >= 16384 or  # Common RTP port range
-                dst_port >= 16384)
+                    rtp_samples.append((frame_time, frame_len, rtp_info[0],
+                                        rtp_info[1], rtp_info[2], rtp_info[4]))
+        
+        if rtp_samples:
+            self._analyze_rtp_batch(rtp_samples)
+        
+        # Update statistics once per batch
+        self.stats.total_packets += len(packets)
+        self.stats.video_packets += video_packets
+        self.stats.rtp_packets += len(rtp_samples)
     
-    def _analyze_rtp_packet(self, rtp_info: Dict, timestamp: float, length: int):
-        """Analyze RTP packet for video metrics"""
-        try:
-            seq_num = int(rtp_info.get('rtp.seq', ['0'])[0])
-            rtp_timestamp = int(rtp_info.get('rtp.timestamp', ['0'])[0])
-            payload_type = int(rtp_info.get('rtp.p_type', ['0'])[0])
-            
+    def _analyze_rtp_batch(self, samples: List[Tuple[float, int, int, int, int, int]]):
+        """
+        Analyze a batch of RTP packets for video metrics.
+        
+        Each sample is (arrival time, frame length, sequence number, RTP
+        timestamp, payload type, SSRC). The capture-wide state is loaded
+        into locals for the batch and stored back once at the end.
+        """
+        payload_type_table = self._payload_type_table
+        rtp_arrival = self._rtp_arrival
+        bitrate_ts = self._bitrate_ts
+        bitrate_bytes = self._bitrate_bytes
+        
+        rtp_sources = self._rtp_sources
+        rtp_head = self._rtp_head
+        rtp_count = self._rtp_count
+        bitrate_head = self._bitrate_head
+        bitrate_tail = self._bitrate_tail
+        last_evict = self._last_evict
+        
+        for timestamp, length, seq_num, rtp_timestamp, payload_type, ssrc in samples:
             # Check if this is a video payload type
-            if payload_type in self.rtp_payload_types:
-                # Calculate jitter (simplified)
-                if len(self.statistics['jitter_samples']) > 0:
-                    last_time = self.statistics['jitter_samples'][-1]['timestamp']
-                    time_diff = (timestamp - last_time) * 1000  # Convert to ms
-                    
-                    if time_diff > 0:
-                        self.statistics['jitter_samples'].append({
-                            'timestamp': timestamp,
-                            'jitter': time_diff,
-                            'seq_num': seq_num
-                        })
-                        
-                        # Keep only recent samples
-                        if len(self.statistics['jitter_samples']) > 100:
-                            self.statistics['jitter_samples'].pop(0)
-                else:
-                    self.statistics['jitter_samples'].append({
-                        'timestamp': timestamp,
-                        'jitter': 0,
-                        'seq_num': seq_num
-                    })
-                
-                # Calculate bitrate
-                self.statistics['bitrate_samples'].append({
-                    'timestamp': timestamp,
-                    'bytes': length
-                })
-                
-                # Keep only recent samples (last 10 seconds)
-                current_time = time.time()
-                self.statistics['bitrate_samples'] = [
-                    s for s in self.statistics['bitrate_samples']
-                    if current_time - s['timestamp'] <= 10
-                ]
+            if not payload_type_table[payload_type]:
+                continue
+            
+            # Calculate jitter (RFC 3550): J += (|D| - J) / 16, where D is
+            # the change in transit time between consecutive packets of the
+            # same source
+            source = rtp_sources.get(ssrc)
+            if source is None:
+                rtp_sources[ssrc] = RtpSource(timestamp, rtp_timestamp, seq_num)
+            else:
+                rtp_diff = (rtp_timestamp - source.rtp_timestamp) & 0xFFFFFFFF
+                if rtp_diff >= 0x80000000:
+                    rtp_diff -= 0x100000000  # Reordered packet
+                transit_diff = ((timestamp - source.arrival) * 1000 -
+                                rtp_diff * 1000 / RTP_VIDEO_CLOCK_RATE)  # ms
+                source.jitter += (abs(transit_diff) - source.jitter) / 16.0
+                source.arrival = timestamp
+                source.rtp_timestamp = rtp_timestamp
                 
-        except Exception as e:
-            logger.error(f"Error analyzing RTP packet: {e}")
+                # Count lost packets from sequence numbers as they arrive
+                source.update_seq(seq_num)
+            
+            # Keep recent arrival times
+            if rtp_count == 0 or timestamp > rtp_arrival[(rtp_head - 1) % RTP_RING_SIZE]:
+                # Oldest sample is overwritten once the ring is full
+                rtp_arrival[rtp_head % RTP_RING_SIZE] = timestamp
+                rtp_head += 1
+                if rtp_count < RTP_RING_SIZE:
+                    rtp_count += 1
+            
+            # Calculate bitrate
+            bitrate_ts[bitrate_head % BITRATE_RING_SIZE] = timestamp
+            bitrate_bytes[bitrate_head % BITRATE_RING_SIZE] = length
+            bitrate_head += 1
+            
+            # Keep only recent samples (last 10 seconds). Samples arrive in
+            # time order, so stale ones are always at the tail; sub-second
+            # precision does not matter for the window, so evict twice a second.
+            if timestamp - last_evict > 0.5:
+                bitrate_tail = max(bitrate_tail, bitrate_head - BITRATE_RING_SIZE)
+                while (bitrate_tail < bitrate_head and
+                       timestamp - bitrate_ts[bitrate_tail % BITRATE_RING_SIZE] > 10):
+                    bitrate_tail += 1
+                last_evict = timestamp
+        
+        self._rtp_head = rtp_head
+        self._rtp_count = rtp_count
+        self._bitrate_head = bitrate_head
+        self._bitrate_tail = bitrate_tail
+        self._last_evict = last_evict
+        
+        # Retire sources that went quiet (a restarted camera comes back
+        # with a new SSRC), keeping their counts in the running totals
+        if samples and timestamp - self._last_source_expiry > 1.0:
+            for ssrc, source in tuple(rtp_sources.items()):
+                if timestamp - source.arrival > RTP_SOURCE_TIMEOUT:
+                    self._retired_expected += source.expected()
+                    self._retired_lost += source.lost()
+                    del rtp_sources[ssrc]
+            self._last_source_expiry = timestamp
+        
+        expected = self._retired_expected
+        lost = self._retired_lost
+        for source in rtp_sources.values():
+            expected += source.expected()
+            lost += source.lost()
+        self._expected_packets = expected
+        self.stats.lost_packets = lost
     
     def get_metrics(self) -> Dict:
         """Get current network metrics"""
+        # Serve repeated callers within a second from the last snapshot
+        now = time.monotonic()
+        if self._metrics_cache and now - self._metrics_cache_time < METRICS_CACHE_TTL:
+            return self._metrics_cache
+        
         try:
+            jitter = self._calculate_jitter()
+            delay = self._calculate_delay()
             metrics = {
-                'total_packets': self.statistics['total_packets'],
-                'video_packets': self.statistics['video_packets'],
-                'rtp_packets': self.statistics['rtp_packets'],
-                'lost_packets': self.statistics['lost_packets'],
-                'jitter': self._calculate_jitter(),
-                'delay': self._calculate_delay(),
-                'latency': self._calculate_latency(),
+                'total_packets': self.stats.total_packets,
+                'video_packets': self.stats.video_packets,
+                'rtp_packets': self.stats.rtp_packets,
+                'lost_packets': self.stats.lost_packets,
+                'jitter': jitter,
+                'delay': delay,
+                'latency': self._calculate_latency(jitter, delay),
                 'bitrate': self._calculate_bitrate(),
                 'packet_loss': self._calculate_packet_loss(),
                 'timestamp': time.time()
             }
             
+            self._metrics_cache = metrics
+            self._metrics_cache_time = now
             return metrics
             
         except Exception as e:
@@ -294,47 +914,57 @@ class PacketCapture:
             return {}
     
     def _calculate_jitter(self) -> float:
-        """Calculate network jitter"""
-        if len(self.statistics['jitter_samples']) < 2:
+        """Calculate network jitter (mean RFC 3550 interarrival jitter of the RTP sources) in ms"""
+        # Snapshot: the capture thread adds and retires sources meanwhile
+        sources = tuple(self._rtp_sources.values())
+        if not sources:
             return 0.0
-        
-        jitter_values = [s['jitter'] for s in self.statistics['jitter_samples']]
-        return sum(jitter_values) / len(jitter_values)
+        return sum(source.jitter for source in sources) / len(sources)
     
     def _calculate_delay(self) -> float:
         """Calculate network delay"""
-        if not self.statistics['jitter_samples']:
-            return 0.0
-        
-        # Simple delay estimation based on packet timing
-        recent_samples = self.statistics['jitter_samples'][-10:]
-        if len(recent_samples) >= 2:
-            time_diff = recent_samples[-1]['timestamp'] - recent_samples[0]['timestamp']
-            return (time_diff * 1000) / len(recent_samples)
+        # Simple delay estimation based on the last 10 packet timings
+        recent = min(self._rtp_count, 10)
+        if recent >= 2:
+            head = self._rtp_head
+            time_diff = (self._rtp_arrival[(head - 1) % RTP_RING_SIZE] -
+                         self._rtp_arrival[(head - recent) % RTP_RING_SIZE])
+            return (time_diff * 1000) / recent
         
         return 0.0
     
-    def _calculate_latency(self) -> float:
+    def _calculate_latency(self, jitter: float, delay: float) -> float:
         """Calculate network latency"""
-        jitter = self._calculate_jitter()
-        delay = self._calculate_delay()
         return (jitter + delay) / 2
     
     def _calculate_bitrate(self) -> float:
         """Calculate current bitrate in Mbps"""
-        if len(self.statistics['bitrate_samples']) < 2:
+        head = self._bitrate_head
+        tail = max(self._bitrate_tail, head - BITRATE_RING_SIZE)
+        if head - tail < 2:
             return 0.0
         
-        # Calculate bitrate over last 5 seconds
-        current_time = time.time()
-        recent_samples = [
-            s for s in self.statistics['bitrate_samples']
-            if current_time - s['timestamp'] <= 5
-        ]
+        # Calculate bitrate over last 5 seconds. Samples are time ordered, so
+        # binary search the ring for the first one inside the window.
+        cutoff_time = time.time() - 5
+        first, last = tail, head
+        while first < last:
+            mid = (first + last) // 2
+            if self._bitrate_ts[mid % BITRATE_RING_SIZE] < cutoff_time:
+                first = mid + 1
+            else:
+                last = mid
         
-        if len(recent_samples) >= 2:
-            total_bytes = sum(s['bytes'] for s in recent_samples)
-            time_span = recent_samples[-1]['timestamp'] - recent_samples[0]['timestamp']
+        if head - first >= 2:
+            # The window is at most two contiguous slices of the ring
+            start = first % BITRATE_RING_SIZE
+            end = head % BITRATE_RING_SIZE
+            if start < end:
+                total_bytes = sum(self._bitrate_bytes[start:end])
+            else:
+                total_bytes = sum(self._bitrate_bytes[start:]) + sum(self._bitrate_bytes[:end])
+            time_span = (self._bitrate_ts[(head - 1) % BITRATE_RING_SIZE] -
+                         self._bitrate_ts[first % BITRATE_RING_SIZE])
             
             if time_span > 0:
                 bitrate = (total_bytes * 8) / time_span  # bits per second
@@ -344,22 +974,20 @@ class PacketCapture:
     
     def _calculate_packet_loss(self) -> float:
         """Calculate packet loss percentage"""
-        if len(self.statistics['jitter_samples']) < 2:
+        if not self._expected_packets:
             return 0.0
         
-        # Analyze sequence numbers for gaps
-        seq_numbers = [s['seq_num'] for s in self.statistics['jitter_samples']]
-        seq_numbers.sort()
-        
-        expected_packets = seq_numbers[-1] - seq_numbers[0] + 1
-        received_packets = len(seq_numbers)
-        
-        if expected_packets > received_packets:
-            lost_packets = expected_packets - received_packets
-            self.statistics['lost_packets'] = lost_packets
-            return (lost_packets / expected_packets) * 100
+        return (self.stats.lost_packets / self._expected_packets) * 100
+    
+    def _capture_alive(self) -> bool:
+        """Whether the active capture backend and its reader thread are running"""
+        if self.capture_process is not None:
+            source_open = self.capture_process.poll() is None
+        else:
+            source_open = self.pcap_handle is not None or self.packet_socket is not None
         
-        return 0.0
+        return (source_open and self.analysis_thread is not None and
+                self.analysis_thread.is_alive())
     
     def get_status(self) -> Dict:
         """Get capture status"""
@@ -367,8 +995,8 @@ class PacketCapture:
             'running': self.running,
             'interface': self.interface,
             'capture_filter': self.capture_filter,
-            'process_alive': self.capture_process is not None and self.capture_process.poll() is None,
-            'uptime': time.time() - self.statistics['start_time'] if self.statistics['start_time'] else 0
+            'process_alive': self._capture_alive(),
+            'uptime': time.time() - self.stats.start_time if self.stats.start_time else 0
         }
 
 def main():
@@ -383,11 +1011,13 @@ def main():
     # Create packet capture instance
     capture = PacketCapture(interface, capture_filter)
     
+    # Set by the signal handler so the monitoring loop wakes up at once
+    stop_requested = threading.Event()
+    
     # Signal handlers
     def signal_handler(signum, frame):
         logger.info("Received signal, stopping capture...")
-        capture.stop_capture()
-        sys.exit(0)
+        stop_requested.set()
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -397,10 +1027,26 @@ def main():
         logger.error("Failed to start packet capture")
         sys.exit(1)
     
+    writer = MetricsWriter(output_file)
+    
+    # Second-resolution timestamp string, formatted once per second
+    last_sec = 0
+    last_iso = ''
+    
+    def now_iso() -> str:
+        nonlocal last_sec, last_iso
+        sec = int(time.time())
+        if sec != last_sec:
+            last_iso = datetime.fromtimestamp(sec).isoformat()
+            last_sec = sec
+        return last_iso
+    
     try:
         # Main monitoring loop
         while capture.running:
-            time.sleep(5)  # Update every 5 seconds
+            # Update every 5 seconds, or stop as soon as a signal arrives
+            if stop_requested.wait(5):
+                break
             
             # Get current metrics
             metrics = capture.get_metrics()
@@ -410,18 +1056,29 @@ def main():
             logger.info(f"Metrics: {metrics}")
             logger.info(f"Status: {status}")
             
-            # Save metrics to file
-            with open(output_file, 'w') as f:
-                json.dump({
-                    'metrics': metrics,
-                    'status': status,
-                    'timestamp': datetime.now().isoformat()
-                }, f, indent=2)
+            # Save metrics to file; written even when no packets arrived,
+            # so the status and timestamp show the monitor is alive
+            writer.submit({
+                'metrics': metrics,
+                'status': status,
+                'timestamp': now_iso()
+            })
+        
+        if not stop_requested.is_set():
+            logger.error("Packet capture stopped unexpectedly")
     
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt")
     finally:
         capture.stop_capture()
+        
+        # Leave the final state in the file, so readers see running: false
+        writer.submit({
+            'metrics': capture.get_metrics(),
+            'status': capture.get_status(),
+            'timestamp': now_iso()
+        })
+        writer.close()
         logger.info("Packet capture stopped")
 
 if __name__ == "__main__":
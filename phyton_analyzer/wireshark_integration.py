@@ -7,11 +7,15 @@ Advanced packet analysis using Wireshark/tshark for deep inspection
 import os
 import sys
 import json
+import shutil
+import struct
 import subprocess
 import tempfile
 import time
+from array import array
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Any
 import logging
 import xml.etree.ElementTree as ET
 
@@ -22,6 +26,113 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _loads_json(data: bytes) -> Any:
+    """Parse JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dumps_json(obj) -> bytes:
+    """Serialize to compact JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def _unwrapped_seq_range(seq: array) -> Tuple[int, int]:
+    """
+    Lowest and highest RTP sequence number once 16-bit wraps are undone.
+    
+    Numbers are extended in arrival order, taking each step as the
+    shortest way round.
+    """
+    extended = lowest = highest = seq[0]
+    prev = seq[0]
+    for num in seq:
+        step = (num - prev) & 0xFFFF
+        extended += step - 0x10000 if step >= 0x8000 else step
+        prev = num
+        if extended < lowest:
+            lowest = extended
+        elif extended > highest:
+            highest = extended
+    return lowest, highest
+
+# Compiled to native code when numba is installed
+if njit is not None:
+    _unwrapped_seq_range = njit(cache=True)(_unwrapped_seq_range)
+
+# Classic pcap magic numbers for microsecond and nanosecond timestamps
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+
+# Read buffer for capture files; the reader asks for one small record at
+# a time, so a large buffer keeps the read() syscall count down
+PCAP_READ_BUFFER = 1 << 20
+
+# IPv4 header offset for link types the capture reader understands:
+# Ethernet, raw IP, Linux cooked capture, raw IPv4
+LINKTYPE_IP_OFFSETS = {1: 14, 101: 0, 113: 16, 228: 0}
+
+def _max_streams_from_env(default: int = 1024) -> int:
+    """MAX_STREAMS environment setting, falling back to default when invalid"""
+    value = os.getenv('MAX_STREAMS')
+    if value is None:
+        return default
+    try:
+        max_streams = int(value)
+    except ValueError:
+        logger.error(f"Invalid MAX_STREAMS {value!r}, using {default}")
+        return default
+    if max_streams < 1:
+        logger.error(f"MAX_STREAMS must be at least 1, using {default}")
+        return default
+    return max_streams
+
+# Most RTP streams held in memory while a capture is analyzed; the least
+# recently updated stream beyond this is summarized to a sidecar file
+MAX_STREAMS = _max_streams_from_env()
+
+IP_PROTOCOL_NAMES = {1: 'icmp', 2: 'igmp', 6: 'tcp', 17: 'udp', 47: 'gre', 50: 'esp', 132: 'sctp'}
+
+class StreamRecord:
+    """
+    RTP packets of one stream, stored column by column
+    
+    Each column is a typed array, so a packet costs a few bytes per field
+    instead of a dict with boxed values.
+    """
+    
+    __slots__ = ('payload_type', 'total_bytes', 'seq', 'rtp_timestamp', 'time', 'length')
+    
+    def __init__(self, payload_type: str):
+        self.payload_type = payload_type
+        self.total_bytes = 0
+        self.seq = array('H')
+        self.rtp_timestamp = array('I')
+        self.time = array('d')
+        self.length = array('I')
+    
+    def __len__(self) -> int:
+        return len(self.seq)
+    
+    def add(self, seq: int, rtp_timestamp: int, time: float, length: int):
+        """Append one packet"""
+        self.seq.append(seq)
+        self.rtp_timestamp.append(rtp_timestamp)
+        self.time.append(time)
+        self.length.append(length)
+        self.total_bytes += length
+
 class WiresharkAnalyzer:
     """
     Advanced Wireshark integration for CCTV packet analysis
@@ -29,8 +140,15 @@ class WiresharkAnalyzer:
     
     def __init__(self, interface: str = "wlan0"):
         self.interface = interface
-        self.temp_dir = tempfile.mkdtemp()
+        # Captures are analyzed right after they are written, so keep them
+        # in memory on tmpfs when it is available; the directory is removed
+        # when the analyzer is garbage collected even without cleanup()
+        tmpfs = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+        self._temp_dir = tempfile.TemporaryDirectory(dir=tmpfs)
+        self.temp_dir = self._temp_dir.name
         self.capture_file = None
+        self._cached_analysis = None
+        self._tshark_available = None
         self.analysis_profiles = {
             'video_streaming': {
                 'protocols': ['rtp', 'rtsp', 'udp'],
@@ -67,6 +185,15 @@ class WiresharkAnalyzer:
     
     def check_wireshark_availability(self) -> bool:
         """Check if Wireshark/tshark is available"""
+        # Starting tshark is slow, so it is only probed once per analyzer
+        if self._tshark_available is not None:
+            return self._tshark_available
+        
+        if not shutil.which('tshark'):
+            logger.error("Wireshark/tshark not available: tshark not found in PATH")
+            self._tshark_available = False
+            return False
+        
         try:
             result = subprocess.run(['tshark', '-v'], 
                                   capture_output=True, 
@@ -74,13 +201,14 @@ class WiresharkAnalyzer:
                                   timeout=10)
             if result.returncode == 0:
                 logger.info("Wireshark/tshark is available")
-                return True
+                self._tshark_available = True
             else:
                 logger.error("tshark command failed")
-                return False
+                self._tshark_available = False
         except Exception as e:
             logger.error(f"Wireshark/tshark not available: {e}")
-            return False
+            self._tshark_available = False
+        return self._tshark_available
     
     def start_live_capture(self, duration: int = 60, 
                           capture_filter: str = "") -> Optional[str]:
@@ -88,13 +216,25 @@ class WiresharkAnalyzer:
         try:
             capture_file = os.path.join(self.temp_dir, f"capture_{int(time.time())}.pcap")
             
-            # Build tshark command for live capture
-            cmd = [
-                'tshark',
-                '-i', self.interface,
-                '-a', f'duration:{duration}',
-                '-w', capture_file
-            ]
+            # Pure capture needs no dissection: use dumpcap directly when it
+            # is installed, otherwise let tshark drive it
+            if shutil.which('dumpcap'):
+                cmd = [
+                    'dumpcap',
+                    '-i', self.interface,
+                    '-a', f'duration:{duration}',
+                    '-P',  # Classic pcap, readable without capinfos
+                    '-q',
+                    '-w', capture_file
+                ]
+            else:
+                cmd = [
+                    'tshark',
+                    '-i', self.interface,
+                    '-a', f'duration:{duration}',
+                    '-F', 'pcap',  # Classic pcap, readable without capinfos
+                    '-w', capture_file
+                ]
             
             if capture_filter:
                 cmd.extend(['-f', capture_filter])
@@ -122,41 +262,78 @@ class WiresharkAnalyzer:
             logger.error(f"Error starting live capture: {e}")
             return None
     
-    def analyze_capture_file(self, pcap_file: str) -> Dict[str, Any]:
-        """Analyze existing capture file"""
+    def analyze_capture_file(self, pcap_file: str,
+                             streams_file: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze existing capture file
+        
+        Summaries of RTP streams evicted beyond MAX_STREAMS are written to
+        streams_file, one JSON object per line, when it is given.
+        """
         try:
             if not os.path.exists(pcap_file):
                 logger.error(f"Capture file not found: {pcap_file}")
                 return {}
             
+            # Re-analyzing an unchanged file returns the previous results
+            stat = os.stat(pcap_file)
+            cache_key = (pcap_file, stat.st_mtime_ns, stat.st_size, streams_file)
+            if self._cached_analysis and self._cached_analysis[0] == cache_key:
+                return self._cached_analysis[1]
+            
             logger.info(f"Analyzing capture file: {pcap_file}")
             
+            # Classic pcap files are summarized directly; capinfos and the
+            # tshark protocol tree are only needed for other formats
+            capture_info = self._read_capture_file(pcap_file)
+            
             # Perform different types of analysis
+            stream_eviction = {'evicted_streams': 0, 'streams_file': None}
+            video_analysis, network_analysis, protocol_analysis = self._analyze_capture(
+                pcap_file, protocol_tree=capture_info is None,
+                streams_file=streams_file, stream_eviction=stream_eviction)
+            
+            if capture_info:
+                statistics, protocol_analysis = capture_info
+            else:
+                statistics = self._get_capture_statistics(pcap_file)
+            
             results = {
-                'video_analysis': self._analyze_video_streams(pcap_file),
-                'network_analysis': self._analyze_network_quality(pcap_file),
-                'protocol_analysis': self._analyze_protocols(pcap_file),
-                'statistics': self._get_capture_statistics(pcap_file)
+                'video_analysis': video_analysis,
+                'network_analysis': network_analysis,
+                'protocol_analysis': protocol_analysis,
+                'statistics': statistics,
+                'stream_eviction': stream_eviction
             }
             
             # Calculate overall quality metrics
             results['quality_metrics'] = self._calculate_quality_metrics(results)
             
+            self._cached_analysis = (cache_key, results)
             return results
             
         except Exception as e:
             logger.error(f"Error analyzing capture file: {e}")
             return {}
     
-    def _analyze_video_streams(self, pcap_file: str) -> Dict[str, Any]:
-        """Analyze video streams in capture"""
+    def _analyze_capture(self, pcap_file: str, protocol_tree: bool = True,
+                         streams_file: Optional[str] = None,
+                         stream_eviction: Optional[Dict[str, Any]] = None
+                         ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        """
+        Dissect the capture once for RTP stream fields and all statistics.
+        
+        Returns the video, network and protocol analysis; the protocol
+        analysis is empty unless protocol_tree is set. Stream evictions are
+        recorded in stream_eviction, see _process_video_packets().
+        """
         try:
-            # Use tshark to extract RTP stream information
+            # One tshark pass prints the packet fields followed by every
+            # statistics table, instead of re-reading the file per analysis
             cmd = [
                 'tshark',
                 '-r', pcap_file,
-                '-Y', 'rtp',
-                '-T', 'json',
+                '-T', 'ek',  # One JSON object per line
                 '-e', 'rtp.seq',
                 '-e', 'rtp.timestamp',
                 '-e', 'rtp.p_type',
@@ -166,106 +343,225 @@ class WiresharkAnalyzer:
                 '-e', 'ip.src',
                 '-e', 'ip.dst',
                 '-e', 'udp.srcport',
-                '-e', 'udp.dstport'
+                '-e', 'udp.dstport',
+                '-z', 'conv,udp',  # UDP conversations
+                '-z', 'io,stat,1'  # I/O statistics per second
             ]
+            if protocol_tree:
+                cmd.extend(['-z', 'ptype,tree'])
+            
+            logger.info(f"Analyzing capture: {' '.join(cmd)}")
+            
+            # Packets are parsed as tshark emits them instead of buffering
+            # its whole output; stderr goes to a file so it cannot fill a
+            # pipe while stdout is being read
+            stats_lines = []
+            with tempfile.TemporaryFile() as stderr:
+                process = subprocess.Popen(cmd,
+                                           stdout=subprocess.PIPE,
+                                           stderr=stderr,
+                                           bufsize=1024 * 1024)
+                reached_eof = False
+                
+                def packets():
+                    nonlocal reached_eof
+                    yield from self._read_ek_packets(process.stdout, stats_lines)
+                    reached_eof = True
+                
+                try:
+                    streams = self._process_video_packets(packets(), streams_file, stream_eviction)
+                    
+                    # If reading or processing stopped before the end of the
+                    # output, nothing drains the pipe any more and tshark
+                    # would block on it until the timeout
+                    if not reached_eof:
+                        logger.error("Stopped reading tshark output early, terminating tshark")
+                        process.kill()
+                    process.wait(timeout=300)
+                finally:
+                    if process.poll() is None:
+                        process.kill()
+                        process.wait()
+                
+                if process.returncode != 0:
+                    stderr.seek(0)
+                    logger.error(f"Capture analysis failed: {stderr.read().decode(errors='replace')}")
+                    return {}, {}, {}
             
-            logger.info(f"Analyzing video streams: {' '.join(cmd)}")
+            network_output, protocol_output = self._split_statistics(stats_lines)
+            return (streams,
+                    self._parse_network_statistics(network_output),
+                    self._parse_protocol_tree(protocol_output))
             
-            result = subprocess.run(cmd, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=300)
-            
-            if result.returncode == 0:
-                packets = json.loads(result.stdout)
-                return self._process_video_packets(packets)
-            else:
-                logger.error(f"Video analysis failed: {result.stderr}")
-                return {}
-                
         except Exception as e:
-            logger.error(f"Error analyzing video streams: {e}")
-            return {}
+            logger.error(f"Error analyzing capture: {e}")
+            return {}, {}, {}
     
-    def _process_video_packets(self, packets: List[Dict]) -> Dict[str, Any]:
-        """Process video packets for quality analysis"""
+    @staticmethod
+    def _read_ek_packets(stream, stats_lines: List[bytes]) -> Iterator[Dict[str, List[str]]]:
+        """
+        Yield the field layers of each RTP packet in tshark -T ek output.
+        
+        Lines that are not JSON belong to the statistics tables printed
+        after the packets and are collected into stats_lines.
+        """
+        for line in stream:
+            if not line.startswith(b'{'):
+                if line.strip():
+                    stats_lines.append(line)
+                continue
+            
+            # Each packet line is preceded by an Elasticsearch bulk index line
+            if line.startswith(b'{"index"'):
+                continue
+            
+            # Without a display filter every packet is printed, only RTP
+            # packets carry a sequence number
+            layers = _loads_json(line).get('layers')
+            if layers and 'rtp_seq' in layers:
+                yield layers
+    
+    @staticmethod
+    def _split_statistics(stats_lines: List[bytes]) -> Tuple[str, str]:
+        """
+        Split tshark statistics output into the network tables (UDP
+        conversations, I/O statistics) and the protocol tree.
+        
+        Each table is printed between two lines of '=' and has its title
+        on the first line inside.
+        """
+        network = []
+        protocols = []
+        table = None
+        
+        for line in stats_lines:
+            text = line.decode(errors='replace')
+            if table is None:
+                if text.startswith('='):
+                    table = [text]
+                continue
+            
+            table.append(text)
+            if text.startswith('='):
+                title = table[1]
+                if 'UDP Conversations' in title or 'IO Statistics' in title:
+                    network.extend(table)
+                else:
+                    protocols.extend(table)
+                table = None
+        
+        return ''.join(network), ''.join(protocols)
+    
+    def _process_video_packets(self, packets: Iterable[Dict[str, List[str]]],
+                               evicted_file: Optional[str] = None,
+                               eviction: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Process video packets for quality analysis
+        
+        At most MAX_STREAMS streams are held at once. Beyond that the least
+        recently updated stream is dropped; its summary is written as one
+        JSON line to evicted_file, which is truncated first. A stream that
+        shows up again afterwards starts a new record. The number of
+        evicted streams and the file written are stored in eviction.
+        """
+        evicted = None
+        evicted_count = 0
         try:
-            streams = {}
-            
-            for packet in packets:
-                layers = packet.get('_source', {}).get('layers', {})
+            streams = OrderedDict()
+            move_to_end = streams.move_to_end
+            
+            # Hot loop: bind builtins and defaults to locals
+            _int = int
+            _float = float
+            no_ip = ('',)
+            zero = ('0',)
+            
+            # ek output names fields with '_' in place of '.'; every field
+            # tshark emits is a non-empty list of values
+            for layers in packets:
+                get = layers.get
                 
-                # Extract packet information
-                frame_time = float(layers.get('frame.time_relative', ['0'])[0])
-                frame_len = int(layers.get('frame.len', ['0'])[0])
+                # Streams are keyed by the address fields themselves, the
+                # stream label is only formatted once per stream
+                stream_key = (get('ip_src', no_ip)[0], get('udp_srcport', zero)[0],
+                              get('ip_dst', no_ip)[0], get('udp_dstport', zero)[0])
                 
-                rtp_seq = layers.get('rtp.seq', ['0'])[0]
-                rtp_timestamp = layers.get('rtp.timestamp', ['0'])[0]
-                rtp_payload_type = layers.get('rtp.p_type', ['0'])[0]
-                
-                src_ip = layers.get('ip.src', [''])[0]
-                dst_ip = layers.get('ip.dst', [''])[0]
-                src_port = layers.get('udp.srcport', ['0'])[0]
-                dst_port = layers.get('udp.dstport', ['0'])[0]
-                
-                # Create stream identifier
-                stream_id = f"{src_ip}:{src_port}->{dst_ip}:{dst_port}"
-                
-                if stream_id not in streams:
-                    streams[stream_id] = {
-                        'packets': [],
-                        'payload_type': rtp_payload_type,
-                        'total_bytes': 0,
-                        'packet_count': 0
-                    }
+                stream = streams.get(stream_key)
+                if stream is not None:
+                    move_to_end(stream_key)
+                else:
+                    if len(streams) >= MAX_STREAMS:
+                        old_key, old_stream = streams.popitem(last=False)
+                        if not evicted_count:
+                            logger.warning(f"More than {MAX_STREAMS} RTP streams, dropping "
+                                           f"the least recently updated ones")
+                        evicted_count += 1
+                        if evicted_file:
+                            if evicted is None:
+                                evicted = open(evicted_file, 'wb')
+                            summary = self._summarize_stream(old_stream)
+                            summary['stream'] = "{}:{}->{}:{}".format(*old_key)
+                            evicted.write(_dumps_json(summary) + b'\n')
+                    
+                    stream = streams[stream_key] = StreamRecord(get('rtp_p_type', zero)[0])
                 
                 # Add packet to stream
-                streams[stream_id]['packets'].append({
-                    'seq': int(rtp_seq),
-                    'timestamp': int(rtp_timestamp),
-                    'time': frame_time,
-                    'length': frame_len
-                })
-                
-                streams[stream_id]['total_bytes'] += frame_len
-                streams[stream_id]['packet_count'] += 1
+                stream.add(_int(get('rtp_seq', zero)[0]),
+                           _int(get('rtp_timestamp', zero)[0]),
+                           _float(get('frame_time_relative', zero)[0]),
+                           _int(get('frame_len', zero)[0]))
             
-            # Analyze each stream
-            for stream_id, stream_data in streams.items():
-                stream_data['analysis'] = self._analyze_single_stream(stream_data)
-            
-            return streams
+            # Analyze each stream; only the summary is kept in the results
+            return {
+                "{}:{}->{}:{}".format(*stream_key): self._summarize_stream(stream)
+                for stream_key, stream in streams.items()
+            }
             
         except Exception as e:
             logger.error(f"Error processing video packets: {e}")
             return {}
+        finally:
+            if evicted is not None:
+                evicted.close()
+            if eviction is not None:
+                eviction['evicted_streams'] = evicted_count
+                eviction['streams_file'] = evicted_file if evicted is not None else None
+    
+    def _summarize_stream(self, stream: StreamRecord) -> Dict[str, Any]:
+        """Result entry for one stream"""
+        return {
+            'payload_type': stream.payload_type,
+            'total_bytes': stream.total_bytes,
+            'packet_count': len(stream),
+            'analysis': self._analyze_single_stream(stream)
+        }
     
-    def _analyze_single_stream(self, stream_data: Dict) -> Dict[str, Any]:
+    def _analyze_single_stream(self, stream: StreamRecord) -> Dict[str, Any]:
         """Analyze a single video stream"""
         try:
-            packets = stream_data['packets']
-            if len(packets) < 2:
+            received_packets = len(stream)
+            if received_packets < 2:
                 return {}
             
-            # Sort packets by sequence number
-            packets.sort(key=lambda x: x['seq'])
-            
-            # Calculate jitter
-            jitter_samples = []
-            for i in range(1, len(packets)):
-                time_diff = (packets[i]['time'] - packets[i-1]['time']) * 1000  # ms
-                jitter_samples.append(time_diff)
-            
-            avg_jitter = sum(jitter_samples) / len(jitter_samples) if jitter_samples else 0
-            
-            # Calculate packet loss
-            expected_packets = packets[-1]['seq'] - packets[0]['seq'] + 1
-            received_packets = len(packets)
+            # Calculate jitter: the mean gap between consecutive packets in
+            # arrival order. The gaps sum to the time between the first and
+            # last packet, so no per-pair pass is needed.
+            duration = stream.time[-1] - stream.time[0]
+            avg_jitter = duration * 1000 / (received_packets - 1)  # ms
+            
+            # Calculate packet loss from the span of sequence numbers
+            seq = stream.seq
+            lowest = min(seq)
+            highest = max(seq)
+            if highest - lowest >= 0x8000:
+                # The 16-bit sequence number wrapped
+                lowest, highest = _unwrapped_seq_range(seq)
+            
+            expected_packets = highest - lowest + 1
             packet_loss = ((expected_packets - received_packets) / expected_packets) * 100 if expected_packets > 0 else 0
             
             # Calculate bitrate
-            duration = packets[-1]['time'] - packets[0]['time']
-            bitrate = (stream_data['total_bytes'] * 8) / duration / 1_000_000 if duration > 0 else 0  # Mbps
+            bitrate = (stream.total_bytes * 8) / duration / 1_000_000 if duration > 0 else 0  # Mbps
             
             # Calculate delay (simplified)
             delay = avg_jitter / 2
@@ -284,33 +580,6 @@ class WiresharkAnalyzer:
             logger.error(f"Error analyzing single stream: {e}")
             return {}
     
-    def _analyze_network_quality(self, pcap_file: str) -> Dict[str, Any]:
-        """Analyze overall network quality"""
-        try:
-            # Get network statistics using tshark
-            cmd = [
-                'tshark',
-                '-r', pcap_file,
-                '-q',  # Quiet mode
-                '-z', 'conv,udp',  # UDP conversations
-                '-z', 'io,stat,1'  # I/O statistics per second
-            ]
-            
-            result = subprocess.run(cmd, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=120)
-            
-            if result.returncode == 0:
-                return self._parse_network_statistics(result.stdout)
-            else:
-                logger.error(f"Network analysis failed: {result.stderr}")
-                return {}
-                
-        except Exception as e:
-            logger.error(f"Error analyzing network quality: {e}")
-            return {}
-    
     def _parse_network_statistics(self, stats_output: str) -> Dict[str, Any]:
         """Parse network statistics from tshark output"""
         try:
@@ -373,31 +642,6 @@ class WiresharkAnalyzer:
             logger.error(f"Error parsing network statistics: {e}")
             return {}
     
-    def _analyze_protocols(self, pcap_file: str) -> Dict[str, Any]:
-        """Analyze protocol distribution"""
-        try:
-            cmd = [
-                'tshark',
-                '-r', pcap_file,
-                '-q',
-                '-z', 'ptype,tree'
-            ]
-            
-            result = subprocess.run(cmd, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=120)
-            
-            if result.returncode == 0:
-                return self._parse_protocol_tree(result.stdout)
-            else:
-                logger.error(f"Protocol analysis failed: {result.stderr}")
-                return {}
-                
-        except Exception as e:
-            logger.error(f"Error analyzing protocols: {e}")
-            return {}
-    
     def _parse_protocol_tree(self, tree_output: str) -> Dict[str, Any]:
         """Parse protocol tree output"""
         try:
@@ -409,7 +653,8 @@ class WiresharkAnalyzer:
                 if line and not line.startswith('=') and 'frames' in line:
                     parts = line.split()
                     if len(parts) >= 2:
-                        protocol = parts[0]
+                        # Lower case, like the names the pcap reader uses
+                        protocol = parts[0].lower()
                         frames = int(parts[1])
                         protocols[protocol] = frames
             
@@ -419,6 +664,85 @@ class WiresharkAnalyzer:
             logger.error(f"Error parsing protocol tree: {e}")
             return {}
     
+    def _read_capture_file(self, pcap_file: str) -> Optional[Tuple[Dict[str, Any], Dict[str, int]]]:
+        """
+        Read packet counts, sizes, timing and the IPv4 protocol distribution
+        straight from a classic pcap file.
+        
+        Returns None for other formats (such as pcapng), which are left to
+        capinfos and tshark.
+        """
+        try:
+            with open(pcap_file, 'rb', buffering=PCAP_READ_BUFFER) as f:
+                header = f.read(24)
+                if len(header) < 24:
+                    return None
+                
+                for endian in ('<', '>'):
+                    magic = struct.unpack(endian + 'I', header[:4])[0]
+                    if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                        break
+                else:
+                    return None
+                
+                ts_scale = 1e-6 if magic == PCAP_MAGIC_USEC else 1e-9
+                linktype = struct.unpack(endian + 'I', header[20:24])[0] & 0x0FFFFFFF
+                link_ip_off = LINKTYPE_IP_OFFSETS.get(linktype)
+                record = struct.Struct(endian + 'IIII')
+                read = f.read
+                
+                packets = 0
+                data_size = 0
+                first_time = last_time = None
+                protocols = {}
+                
+                while True:
+                    record_header = read(16)
+                    if len(record_header) < 16:
+                        break
+                    
+                    ts_sec, ts_frac, incl_len, orig_len = record.unpack(record_header)
+                    data = read(incl_len)
+                    
+                    packets += 1
+                    data_size += orig_len
+                    last_time = ts_sec + ts_frac * ts_scale
+                    if first_time is None:
+                        first_time = last_time
+                    
+                    protocol = 'other'
+                    if link_ip_off is not None:
+                        ip_off = link_ip_off
+                        if linktype == 1 and data[12:14] == b'\x81\x00':
+                            ip_off += 4  # 802.1Q VLAN tag
+                        
+                        # Link types with an ethertype must announce IPv4
+                        if ((ip_off == 0 or data[ip_off - 2:ip_off] == b'\x08\x00') and
+                                len(data) > ip_off + 9 and data[ip_off] >> 4 == 4):
+                            number = data[ip_off + 9]
+                            protocol = IP_PROTOCOL_NAMES.get(number) or f"ip.proto={number}"
+                    
+                    protocols[protocol] = protocols.get(protocol, 0) + 1
+            
+            duration = last_time - first_time if packets else 0.0
+            statistics = {
+                'File name': pcap_file,
+                'File type': 'pcap',
+                'Number of packets': packets,
+                'Data size': data_size,
+                'Capture duration': duration,
+                'First packet time': first_time,
+                'Last packet time': last_time,
+                'Data byte rate': data_size / duration if duration > 0 else 0.0,
+                'Average packet size': data_size / packets if packets else 0.0
+            }
+            
+            return statistics, protocols
+            
+        except Exception as e:
+            logger.error(f"Error reading capture file: {e}")
+            return None
+    
     def _get_capture_statistics(self, pcap_file: str) -> Dict[str, Any]:
         """Get basic capture statistics"""
         try:
@@ -544,6 +868,13 @@ class WiresharkAnalyzer:
                         report.append(f"    Packets: {analysis.get('total_packets', 0)}")
                     report.append("")
             
+            stream_eviction = analysis_results.get('stream_eviction', {})
+            if stream_eviction.get('evicted_streams'):
+                report.append(f"  Streams beyond the limit of {MAX_STREAMS}: "
+                              f"{stream_eviction['evicted_streams']}, "
+                              f"summarized in {stream_eviction.get('streams_file') or 'no file'}")
+                report.append("")
+            
             # Network statistics
             network_analysis = analysis_results.get('network_analysis', {})
             if network_analysis:
@@ -571,8 +902,7 @@ class WiresharkAnalyzer:
         """Clean up temporary files"""
         try:
             if os.path.exists(self.temp_dir):
-                import shutil
-                shutil.rmtree(self.temp_dir)
+                self._temp_dir.cleanup()
                 logger.info(f"Cleaned up temporary directory: {self.temp_dir}")
         except Exception as e:
             logger.error(f"Error cleaning up: {e}")
@@ -603,19 +933,22 @@ def main():
             logger.error("Failed to capture packets")
             sys.exit(1)
         
-        # Analyze capture
+        # Analyze capture; the capture itself lives in the analyzer's
+        # temporary directory, so evicted streams go to the output directory
+        stamp = int(time.time())
         logger.info("Analyzing capture file...")
-        results = analyzer.analyze_capture_file(capture_file)
+        results = analyzer.analyze_capture_file(
+            capture_file, os.path.join(output_dir, f"streams_{stamp}.jsonl"))
         
         # Generate report
         report = analyzer.generate_report(results)
         
-        # Save results
-        output_file = os.path.join(output_dir, f"analysis_{int(time.time())}.json")
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+        # Save results; the JSON is for tools, the report for people
+        output_file = os.path.join(output_dir, f"analysis_{stamp}.json")
+        with open(output_file, 'wb') as f:
+            f.write(_dumps_json(results))
         
-        report_file = os.path.join(output_dir, f"report_{int(time.time())}.txt")
+        report_file = os.path.join(output_dir, f"report_{stamp}.txt")
         with open(report_file, 'w') as f:
             f.write(report)
         